@@ -1,70 +1,140 @@
 import os
 import time
+import asyncio
+import aiohttp
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import yfinance as yf
-from datetime import datetime, timedelta, timezone
-from io import StringIO  # 用來修復 pandas read_html 的報錯
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from lxml import html as lxhtml
 
-def get_earnings_tickers_yahoo(start_date, end_date):
-    """主引擎：加入 Cookie 預熱、完整現代瀏覽器偽裝與 StringIO 解析"""
-    print(f"📥 [主引擎] 正在從 Yahoo Finance 抓取 {start_date} 至 {end_date} 的財報日曆...")
-    tickers = set()
-    
-    # 建立 Session 來保存 Cookies，這是突破防火牆的關鍵
-    session = requests.Session()
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Sec-Fetch-User': '?1',
-    }
-    session.headers.update(headers)
-    
-    try:
+NY = ZoneInfo("America/New_York")
+
+CACHE_DIR = './.cache_ep'
+CACHE_TTL = 3600  # 秒
+
+QUOTE_COLUMNS = ['symbol', 'marketCap', 'averageVolume', 'shortName']
+QUOTE_FIELDS = 'symbol,shortName,marketCap,averageDailyVolume3Month'
+YAHOO_API_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
+
+# 完整現代瀏覽器偽裝，用於 Yahoo 財報日曆網頁
+YAHOO_HEADERS = {
+    'User-Agent': YAHOO_API_UA,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+}
+
+# ===== 美股大師級 AI 提示詞組合 (固定模板，只需代入日期與名單) =====
+PROMPT_TEMPLATE = """🗽 **美股 NTRT 盤前雷達 ({today_str})** 🗽
+請複製以下提示詞，交由 AI 進行盤前質化決選：
+
+```text
+你是一位精通 StockBee Episodic Pivot (EP) 策略的美股頂尖交易員。
+請從以下「剛發布財報、營收暴增且平時被冷落」的美股初篩名單中，挑選出最具爆發潛力的 1~5 檔股票。
+
+【初篩名單 (已按 YoY 排序)】
+{stock_list_str}
+【分析要求】
+請務必「聯網搜尋」名單上每家公司在過去 24 小時內發布的「Earnings Call (法說會) 逐字稿重點或財報新聞」。
+
+【EP 完美催化劑標準】
+1. 成長型 (Growth EP)：接獲新訂單，且「強力上修未來幾季的財測指引 (Guidance Raises)」。
+2. 轉機型 (Turnaround EP)：處於循環底部，財報顯示「由虧轉盈 (Inflection)」，這類股票適合做更長期的波段。
+3. 題材型 (Story EP)：獲得政府重大政策補助、FDA 新藥批准、重量級企業結盟，或搭上全新熱門產業的超級題材。
+
+【美股專屬交易鐵律 (請在分析結果中標註提醒)】
+若該股票盤前跳空幅度大於 40% (Gap > 40%)，請標註「禁止 OPG 市價追高，需轉入延遲反應 (Delayed Reaction) 觀察池等待突破」。
+
+【輸出格式】
+直接回覆精煉後的 1~5 檔標的。標註 EP 類型，並用 100 字簡述你查到的「Earnings 催化劑亮點」。
+```"""
+
+# 財報日曆中 Symbol 欄的儲存格 (新版頁面代號包在 <a> 內的 <span>，需取整格文字；
+# 不要求 tbody，libxml2 不會自動補上)，舊版頁面以 data-test="quoteLink" 標記
+YAHOO_SYMBOL_XPATH = (
+    '//table[.//th[contains(., "Symbol")]]//tr/td[1]'
+    ' | //a[@data-test="quoteLink"]'
+)
+
+# 全域共用 Session：連線池 + Keep-Alive 省去每次的 TCP/TLS 握手，
+# 用於 Yahoo crumb 取得 (其 Cookies 會轉交 aiohttp 報價請求)、Finnhub 與 Discord
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount('http://', _adapter)
+SESSION.mount('https://', _adapter)
+
+def is_us_ticker(symbol):
+    """美股代號判斷：非空字串且不含 . (如 RY.TO、0700.HK 等海外代號)，純字元比對不經 regex"""
+    return isinstance(symbol, str) and symbol != '' and '.' not in symbol
+
+async def fetch_yahoo_calendars(dates):
+    """Cookie 預熱後，同時抓取多個日期的財報日曆網頁"""
+    timeout = aiohttp.ClientTimeout(total=15)
+    connector = aiohttp.TCPConnector(limit=20, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(headers=YAHOO_HEADERS, timeout=timeout, connector=connector) as session:
         print("🍪 正在進行 Yahoo 伺服器 Cookie 預熱...")
-        # 先訪問首頁獲取合法憑證
-        session.get("https://finance.yahoo.com/", timeout=15)
-        time.sleep(1.5) 
-        
-        dates_to_fetch = [start_date, end_date]
+        # 先訪問首頁獲取合法憑證 (後續請求依賴此 Cookie，必須先完成)
+        async with session.get("https://finance.yahoo.com/") as res:
+            await res.read()
+        await asyncio.sleep(1.5)
         
-        for date_str in dates_to_fetch:
+        async def fetch(date_str):
             url = f"https://finance.yahoo.com/calendar/earnings?day={date_str}"
-            try:
-                res = session.get(url, timeout=15)
+            async with session.get(url) as res:
+                return res.status, await res.read()
                 
-                # 檢查是否被伺服器阻擋
-                if "ApacheTrafficServer" in res.text or res.status_code != 200:
-                    print(f"⚠️ Yahoo 伺服器仍阻擋連線 (Status: {res.status_code})")
-                    continue
-                    
-                # 【關鍵修復】使用 StringIO 避免 pandas 2.1.0 以上版本報錯
-                try:
-                    dfs = pd.read_html(StringIO(res.text))
-                    if dfs:
-                        df = dfs[0]
-                        if 'Symbol' in df.columns:
-                            # 排除含有 . 的非美股代號
-                            symbols = df[~df['Symbol'].str.contains(r'\.', na=False)]['Symbol'].unique().tolist()
-                            tickers.update(symbols)
-                except ValueError:
-                    print(f"⚠️ Yahoo {date_str} 找不到財報表格 (可能當日無財報發布)。")
-                    
-            except Exception as e:
-                print(f"⚠️ Yahoo {date_str} 日曆抓取失敗: {e}")
-            
-            time.sleep(2.5) 
-            
+        return await asyncio.gather(*[fetch(d) for d in dates], return_exceptions=True)
+
+def get_earnings_tickers_yahoo(start_date, end_date):
+    """主引擎：加入 Cookie 預熱、完整現代瀏覽器偽裝與 lxml XPath 解析"""
+    print(f"📥 [主引擎] 正在從 Yahoo Finance 抓取 {start_date} 至 {end_date} 的財報日曆...")
+    tickers = {}  # 以 dict 當作保序的 set
+    dates_to_fetch = [start_date, end_date]
+    
+    try:
+        results = asyncio.run(fetch_yahoo_calendars(dates_to_fetch))
     except Exception as e:
         print(f"⚠️ Yahoo 主引擎初始化失敗: {e}")
+        results = []
         
+    for date_str, result in zip(dates_to_fetch, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Yahoo {date_str} 日曆抓取失敗: {result}")
+            continue
+            
+        status, body = result
+        # 檢查是否被伺服器阻擋
+        if b"ApacheTrafficServer" in body or status != 200:
+            print(f"⚠️ Yahoo 伺服器仍阻擋連線 (Status: {status})")
+            continue
+            
+        try:
+            # 只用 XPath 取出 Symbol 欄，不必把整頁所有表格解析成 DataFrame
+            tree = lxhtml.fromstring(body)
+            symbols = [el.text_content().strip() for el in tree.xpath(YAHOO_SYMBOL_XPATH)]
+            symbols = [s for s in symbols if s]
+        except Exception as e:
+            print(f"⚠️ Yahoo {date_str} 日曆解析失敗: {e}")
+            continue
+            
+        if symbols:
+            # 排除含有 . 的非美股代號
+            tickers.update(dict.fromkeys(filter(is_us_ticker, symbols)))
+        else:
+            print(f"⚠️ Yahoo {date_str} 找不到財報表格 (可能當日無財報發布)。")
+            
     if tickers:
         print(f"✅ [主引擎] 成功從 Yahoo 獲取 {len(tickers)} 檔財報代號。")
         return list(tickers)
@@ -80,14 +150,14 @@ def get_earnings_tickers_finnhub(api_key, start_date, end_date):
         
     url = f"https://finnhub.io/api/v1/calendar/earnings?from={start_date}&to={end_date}&token={api_key}"
     try:
-        res = requests.get(url, timeout=15)
+        res = SESSION.get(url, timeout=15)
         if res.status_code == 200:
-            data = res.json()
+            data = orjson.loads(res.content)
             if 'earningsCalendar' in data:
-                df = pd.DataFrame(data['earningsCalendar'])
-                if not df.empty and 'symbol' in df.columns:
-                    # 排除非美股
-                    symbols = df[~df['symbol'].str.contains(r'\.', na=False)]['symbol'].unique().tolist()
+                # 排除非美股，並以 dict.fromkeys 保序去重
+                symbols = [row.get('symbol') for row in data['earningsCalendar']]
+                symbols = list(dict.fromkeys(filter(is_us_ticker, symbols)))
+                if symbols:
                     print(f"✅ [備援引擎] 成功從 Finnhub 獲取 {len(symbols)} 檔財報代號。")
                     return symbols
         else:
@@ -97,73 +167,296 @@ def get_earnings_tickers_finnhub(api_key, start_date, end_date):
         
     return []
 
-def get_earnings_tickers(finnhub_key):
+def cached_fetch(provider, start_date, end_date, fetch):
+    """財報日曆磁碟快取：以 (來源, 起日, 迄日) 為鍵，1 小時內重跑直接讀檔，節省 API 額度"""
+    path = os.path.join(CACHE_DIR, f"{provider}_{start_date}_{end_date}.json")
+    
+    # 設定 NTRT_NO_CACHE 可強制略過快取
+    if not os.environ.get('NTRT_NO_CACHE'):
+        try:
+            if time.time() - os.path.getmtime(path) < CACHE_TTL:
+                with open(path, 'rb') as f:
+                    tickers = orjson.loads(f.read())
+                print(f"💾 使用 {provider} 快取 ({len(tickers)} 檔)，略過外部請求。")
+                return tickers
+        except (OSError, ValueError):
+            pass
+            
+    tickers = fetch()
+    # 只快取成功的結果，避免把暫時性的失敗鎖住一小時
+    if tickers:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(orjson.dumps(tickers))
+        except OSError as e:
+            print(f"⚠️ 財報日曆快取寫入失敗: {e}")
+    return tickers
+
+def get_earnings_tickers(finnhub_key, today):
     """終極聯集引擎：Finnhub 與 Yahoo 雙管齊下，確保不漏接任何微型飆股"""
-    # 以 UTC-5 (美東時間) 為基準
-    today = datetime.now(timezone.utc) - timedelta(hours=5) 
-    start_date = (today - timedelta(days=1)).strftime('%Y-%m-%d')
-    end_date = today.strftime('%Y-%m-%d')
+    start_date = (today - timedelta(days=1)).isoformat()
+    end_date = today.isoformat()
     
-    all_tickers = set() # 使用 set 來自動去除重複的代號
+    all_tickers = {} # 使用 dict 來自動去除重複的代號並保留順序
     
     # 引擎 A：Finnhub API (資料最完整，包含大量微型股)
     print("===================================")
     if finnhub_key:
-        f_tickers = get_earnings_tickers_finnhub(finnhub_key, start_date, end_date)
+        f_tickers = cached_fetch('finnhub', start_date, end_date,
+                                 lambda: get_earnings_tickers_finnhub(finnhub_key, start_date, end_date))
         if f_tickers:
-            all_tickers.update(f_tickers)
+            all_tickers.update(dict.fromkeys(f_tickers))
     else:
         print("⚠️ 未提供 Finnhub Key，跳過 API 抓取。")
         
     # 引擎 B：Yahoo 網頁爬蟲 (輔助抓漏與備援)
     print("-----------------------------------")
+    # 不快取：Yahoo 常部分日期被阻擋，快取會把不完整的結果鎖住一小時
     y_tickers = get_earnings_tickers_yahoo(start_date, end_date)
     if y_tickers:
-        all_tickers.update(y_tickers)
+        all_tickers.update(dict.fromkeys(y_tickers))
     print("===================================")
         
     final_list = list(all_tickers)
     print(f"🎯 [雙引擎整合] 最終共收集到 {len(final_list)} 檔不重複的財報代號！")
     return final_list
     
-def filter_us_ep_candidates(tickers, max_cap=10000000000, max_vol=1500000):
-    """執行 yfinance 核心濾網：YoY > 39%、市值 < 10B、均量 < 1.5M"""
+def get_yahoo_crumb():
+    """取得 Yahoo quoteSummary API 所需的 Cookie 與 crumb (與 yfinance 相同流程)"""
+    headers = {'User-Agent': YAHOO_API_UA}
+    try:
+        # 先拿到 A3 Cookie，再換取 crumb
+        SESSION.get("https://fc.yahoo.com", headers=headers, timeout=15)
+        res = SESSION.get("https://query2.finance.yahoo.com/v1/test/getcrumb", headers=headers, timeout=15)
+        crumb = res.text.strip()
+        if res.status_code == 200 and crumb and '<' not in crumb:
+            return crumb, SESSION.cookies.get_dict()
+        print(f"⚠️ 取得 Yahoo crumb 失敗 (Status: {res.status_code})")
+    except Exception as e:
+        print(f"⚠️ 取得 Yahoo crumb 失敗: {e}")
+    return None, {}
+
+def _raw(module, key):
+    """quoteSummary 的數值欄位格式為 {'raw': ..., 'fmt': ...}，取出原始值"""
+    value = (module or {}).get(key)
+    if isinstance(value, dict):
+        return value.get('raw')
+    return value
+
+class AdaptiveRateLimiter:
+    """非同步權杖桶限速器：只在接近 Yahoo 限流門檻時才等待，
+    遇到 429 速率減半，連續 success_window 次成功後再加倍回升 (上限 max_rate)"""
+    
+    def __init__(self, rate=15, max_rate=30, min_rate=1, success_window=50):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.success_window = success_window
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.last_cut = float('-inf')
+        self.successes = 0
+        self.lock = asyncio.Lock()
+        
+    async def acquire(self):
+        """取得一個權杖，回傳發出請求的時間點 (供 on_throttled 判斷是否為舊請求)"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                
+    def on_success(self):
+        self.successes += 1
+        if self.successes >= self.success_window:
+            self.rate = min(self.max_rate, self.rate * 2)
+            self.successes = 0
+            
+    def on_throttled(self, issued_at):
+        # 同一波併發請求會一起收到 429，只對上次降速之後才發出的請求再減半
+        if issued_at < self.last_cut:
+            return
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.last_cut = time.monotonic()
+        # 同步重設補充起點，否則下次 acquire 會把上次取權杖以來的時間一次補滿
+        self.tokens = 0
+        self.updated = self.last_cut
+        self.successes = 0
+
+async def get_json(session, sem, limiter, url, params, retries=3):
+    """經限速器發出 GET，遇到 429 以指數退避重試"""
+    for attempt in range(retries + 1):
+        async with sem:
+            issued_at = await limiter.acquire()
+            async with session.get(url, params=params) as res:
+                if res.status != 429:
+                    res.raise_for_status()
+                    limiter.on_success()
+                    return await res.json(loads=orjson.loads)
+        limiter.on_throttled(issued_at)
+        if attempt < retries:
+            await asyncio.sleep(0.5 * 2 ** attempt)
+    raise RuntimeError(f"Yahoo 持續限流 (429): {url}")
+
+async def fetch_quotes(session, sem, limiter, chunk, crumb):
+    """批次抓取 /v7/finance/quote，一次請求最多 20 檔代號"""
+    url = "https://query1.finance.yahoo.com/v7/finance/quote"
+    params = {'symbols': ','.join(chunk), 'fields': QUOTE_FIELDS, 'crumb': crumb}
+    data = await get_json(session, sem, limiter, url, params)
+    
+    return [
+        {
+            'symbol': q.get('symbol'),
+            'marketCap': q.get('marketCap'),
+            'averageVolume': q.get('averageDailyVolume3Month'),
+            'shortName': q.get('shortName') or q.get('symbol'),
+        }
+        for q in data['quoteResponse']['result']
+    ]
+
+async def fetch_info(session, sem, limiter, ticker, crumb):
+    """非同步抓取單一代號的 quoteSummary (僅能單檔查詢)，回傳營收成長率"""
+    url = f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{ticker}"
+    # 只要營收成長率，僅請求 financialData 模組 (yfinance .info 會一次拉 20 多個模組)
+    params = {'modules': 'financialData', 'crumb': crumb}
+    data = await get_json(session, sem, limiter, url, params)
+    
+    result = data['quoteSummary']['result'][0]
+    return _raw(result.get('financialData'), 'revenueGrowth')
+
+async def run_all(tickers, crumb, cookies, max_cap, max_vol, concurrency=10, batch_size=20):
+    """先批次抓報價做市值/均量初篩，再只對通過者併發查詢營收成長。
+    回傳 (df, missed)：missed 為批次報價失敗、需另行補抓的代號；df 為 None 時代表整段失敗"""
+    timeout = aiohttp.ClientTimeout(total=20)
+    headers = {'User-Agent': YAHOO_API_UA}
+    connector = aiohttp.TCPConnector(limit=20, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(headers=headers, cookies=cookies, timeout=timeout, connector=connector) as session:
+        sem = asyncio.Semaphore(concurrency)
+        limiter = AdaptiveRateLimiter()
+        
+        chunks = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+        batches = await asyncio.gather(
+            *[fetch_quotes(session, sem, limiter, c, crumb) for c in chunks],
+            return_exceptions=True,
+        )
+        if batches and all(isinstance(b, Exception) for b in batches):
+            # 批次報價全數失敗 (例如 crumb 失效)，交由呼叫端改走備援
+            return None, tickers
+            
+        # 部分批次失敗時，一次會少掉整批 20 檔，記下來交由呼叫端補抓
+        missed = [s for c, b in zip(chunks, batches) if isinstance(b, Exception) for s in c]
+        if missed:
+            print(f"⚠️ {len(missed)} 檔代號的批次報價抓取失敗，稍後改用 yfinance 補抓。")
+        quotes = [q for batch in batches if not isinstance(batch, Exception) for q in batch]
+        df = to_numeric_columns(pd.DataFrame(quotes, columns=QUOTE_COLUMNS))
+        
+        # 市值與均量在批次報價中就有，先淘汰不合格者以減少單檔請求
+        df = apply_ep_filters(df, max_cap, max_vol)
+        growths = await asyncio.gather(
+            *[fetch_info(session, sem, limiter, t, crumb) for t in df['symbol']],
+            return_exceptions=True,
+        )
+        
+    if growths and all(isinstance(g, Exception) for g in growths):
+        # quoteSummary 全數失敗 (例如 v10 拒絕 crumb 回 401、429 重試耗盡)，
+        # 不可當成「營收成長皆不足」，只將通過初篩者 (與批次失敗者) 交由呼叫端備援
+        return None, list(df['symbol']) + missed
+        
+    # 個別代號抓取失敗 (下市、無資料) 視為無營收成長資料
+    df['revenueGrowth'] = pd.Series(
+        [None if isinstance(g, Exception) else g for g in growths], index=df.index, dtype=float
+    )
+    return df, missed
+
+def _probe(ticker):
+    """備援用：以 yfinance 取得單一代號的濾網欄位"""
+    info = yf.Ticker(ticker).info
+    return {
+        'symbol': ticker,
+        'marketCap': info.get('marketCap'),
+        'averageVolume': info.get('averageVolume'),
+        'shortName': info.get('shortName', ticker),
+        'revenueGrowth': info.get('revenueGrowth'),
+    }
+
+def fetch_info_threaded(tickers, max_workers=4):
+    """同步備援引擎：以執行緒池平行呼叫 yfinance .info，收齊後一次建立 DataFrame。
+    備援多半在 Yahoo 已限流時觸發，併發數刻意壓低"""
+    records = []
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = [ex.submit(_probe, t) for t in tickers]
+        for f in as_completed(futures):
+            try:
+                records.append(f.result())
+            except Exception:
+                pass
+    if tickers and not records:
+        # 全部代號都抓不到，代表資料源故障而非「無符合標的」
+        return None
+    return to_numeric_columns(pd.DataFrame(records, columns=QUOTE_COLUMNS + ['revenueGrowth']))
+
+def to_numeric_columns(df):
+    """將濾網用到的數值欄轉為 float (None → NaN)，讓 query 可直接在 NumPy 陣列上比較"""
+    for c in ['marketCap', 'averageVolume', 'revenueGrowth']:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype(float)
+    return df
+
+def apply_ep_filters(df, max_cap, max_vol, min_growth=None):
+    """以單一 query 表達式執行濾網；NaN 比較結果為 False，缺值自動淘汰"""
+    expr = "marketCap <= @max_cap and averageVolume <= @max_vol"
+    if min_growth is not None:
+        expr = "revenueGrowth >= @min_growth and " + expr
+    return df.query(expr).copy()
+
+def filter_us_ep_candidates(tickers, max_cap=10000000000, max_vol=1500000, min_growth=0.39):
+    """執行核心濾網：YoY > 39%、市值 < 10B、均量 < 1.5M；資料源全數失敗時回傳 None"""
     print(f"🔍 開始執行營收 YoY 與冷落濾網，預計檢查 {len(tickers)} 檔股票...")
-    ep_list = []
     
-    for ticker in tickers:
+    df, missed = None, tickers
+    crumb, cookies = get_yahoo_crumb()
+    if crumb:
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            df, missed = asyncio.run(run_all(tickers, crumb, cookies, max_cap, max_vol))
+        except Exception as e:
+            print(f"⚠️ Yahoo 非同步抓取失敗: {e}")
             
-            # 1. 營收成長過濾 (revenueGrowth > 0.39)
-            rev_growth = info.get('revenueGrowth')
-            if rev_growth is None or rev_growth < 0.39:
-                continue
-                
-            # 2. 市值過濾 (< 10 Billion USD)
-            market_cap = info.get('marketCap')
-            if market_cap is None or market_cap > max_cap:
-                continue
-                
-            # 3. 籌碼過濾 (< 1.5M Shares)
-            vol = info.get('averageVolume')
-            if vol is None or vol > max_vol:
-                continue
-                
-            ep_list.append({
-                'Ticker': ticker,
-                'Name': info.get('shortName', ticker),
-                'YoY(%)': round(rev_growth * 100, 1),
-                'MarketCap(B)': round(market_cap / 1e9, 2),
-                'AvgVol(K)': round(vol / 1000, 1)
-            })
-        except Exception:
-            pass
-        # 避免觸發 yfinance 阻擋，加入微小延遲
-        time.sleep(0.2) 
+    if df is None:
+        print(f"🧵 改用 yfinance 多執行緒備援抓取 {len(missed)} 檔...")
+        df = fetch_info_threaded(missed)
+        if df is None:
+            print("❌ yfinance 備援亦無法取得任何報價資料。")
+            return None
+    elif missed:
+        # 只補抓批次失敗的代號，合併後再一起套用濾網
+        extra = fetch_info_threaded(missed)
+        if extra is not None:
+            df = pd.concat([df, extra], ignore_index=True)
+    
+    # 三道濾網合併為單一向量化表達式：營收成長 > 39%、市值、均量
+    df = apply_ep_filters(df, max_cap, max_vol, min_growth)
+    if df.empty:
+        return pd.DataFrame()
         
-    return pd.DataFrame(ep_list)
+    df_ep = pd.DataFrame({
+        'Ticker': df['symbol'],
+        'Name': df['shortName'],
+        'YoY(%)': (df['revenueGrowth'] * 100).round(1),
+        'MarketCap(B)': (df['marketCap'] / 1e9).round(2),
+        'AvgVol(K)': (df['averageVolume'] / 1e3).round(1),
+    }).reset_index(drop=True)
+    
+    # 數值欄降為 float32、字串欄轉 category，縮小記憶體並加快後續排序
+    for c in ['YoY(%)', 'MarketCap(B)', 'AvgVol(K)']:
+        df_ep[c] = pd.to_numeric(df_ep[c], downcast='float')
+    df_ep['Ticker'] = df_ep['Ticker'].astype('category')
+    df_ep['Name'] = df_ep['Name'].astype('category')
+    return df_ep
 
 def send_to_discord(content):
     """將結果推播至 Discord"""
@@ -172,53 +465,50 @@ def send_to_discord(content):
         print("⚠️ 未設定 DISCORD_WEBHOOK_URL，跳過推播。")
         return
         
-    # 確保不會超過 Discord 字數限制
-    if len(content) > 1950:
-        content = content[:1950] + "\n...(名單過長已截斷)"
-    requests.post(webhook_url, json={"content": content})
+    # 確保不會超過 Discord 字數限制 (以 UTF-16 code unit 計算，emoji 佔 2 個單位)
+    encoded = content.encode('utf-16-le')
+    if len(encoded) > 1950 * 2:
+        content = encoded[:1950 * 2].decode('utf-16-le', errors='ignore') + "\n...(名單過長已截斷)"
+    SESSION.post(webhook_url, data=orjson.dumps({"content": content}),
+                 headers={"Content-Type": "application/json"}, timeout=15)
     print("✅ 成功發送至 Discord！")
 
-if __name__ == "__main__":
+def main():
     finnhub_key = os.environ.get('FINNHUB_API_KEY')
-    today_str = (datetime.now(timezone.utc) - timedelta(hours=5)).strftime('%Y-%m-%d')
+    # 以美東時間為基準 (ZoneInfo 自動處理夏令時間)，整次執行只取一次日期
+    today = datetime.now(NY).date()
+    today_str = today.isoformat()
     print(f"🚀 啟動美股 NTRT 盤前掃描 ({today_str})")
     
     # 雙引擎獲取名單
-    tickers = get_earnings_tickers(finnhub_key)
-    
-    if tickers:
-        df_ep = filter_us_ep_candidates(tickers)
-        
-        if not df_ep.empty:
-            # 依 YoY 排序並取 Top 10，確保提示詞精練
-            df_ep = df_ep.sort_values(by='YoY(%)', ascending=False).head(10)
-            
-            stock_list_str = ""
-            for idx, row in df_ep.iterrows():
-                stock_list_str += f"- ${row['Ticker']} {row['Name']} | YoY: {row['YoY(%)']}% | 市值: ${row['MarketCap(B)']}B | 均量: {row['AvgVol(K)']}K\n"
-            
-            # ===== 美股大師級 AI 提示詞組合 =====
-            discord_msg = f"🗽 **美股 NTRT 盤前雷達 ({today_str})** 🗽\n"
-            discord_msg += "請複製以下提示詞，交由 AI 進行盤前質化決選：\n\n"
-            discord_msg += "```text\n"
-            discord_msg += "你是一位精通 StockBee Episodic Pivot (EP) 策略的美股頂尖交易員。\n"
-            discord_msg += "請從以下「剛發布財報、營收暴增且平時被冷落」的美股初篩名單中，挑選出最具爆發潛力的 1~5 檔股票。\n\n"
-            discord_msg += "【初篩名單 (已按 YoY 排序)】\n"
-            discord_msg += stock_list_str + "\n"
-            discord_msg += "【分析要求】\n"
-            discord_msg += "請務必「聯網搜尋」名單上每家公司在過去 24 小時內發布的「Earnings Call (法說會) 逐字稿重點或財報新聞」。\n\n"
-            discord_msg += "【EP 完美催化劑標準】\n"
-            discord_msg += "1. 成長型 (Growth EP)：接獲新訂單，且「強力上修未來幾季的財測指引 (Guidance Raises)」。\n"
-            discord_msg += "2. 轉機型 (Turnaround EP)：處於循環底部，財報顯示「由虧轉盈 (Inflection)」，這類股票適合做更長期的波段。\n"
-            discord_msg += "3. 題材型 (Story EP)：獲得政府重大政策補助、FDA 新藥批准、重量級企業結盟，或搭上全新熱門產業的超級題材。\n\n"
-            discord_msg += "【美股專屬交易鐵律 (請在分析結果中標註提醒)】\n"
-            discord_msg += "若該股票盤前跳空幅度大於 40% (Gap > 40%)，請標註「禁止 OPG 市價追高，需轉入延遲反應 (Delayed Reaction) 觀察池等待突破」。\n\n"
-            discord_msg += "【輸出格式】\n"
-            discord_msg += "直接回覆精煉後的 1~5 檔標的。標註 EP 類型，並用 100 字簡述你查到的「Earnings 催化劑亮點」。\n"
-            discord_msg += "```"
-            
-            send_to_discord(discord_msg)
-        else:
-            send_to_discord(f"📊 **美股 NTRT 盤前雷達 ({today_str})**\n昨晚至今日盤前發布財報的公司中，無符合「YoY>39% + 市值<10B + 均量<1.5M」的量化標的。")
-    else:
+    tickers = get_earnings_tickers(finnhub_key, today)
+    if not tickers:
         print("今日查無財報發布數據 (雙引擎皆未回傳資料)。")
+        return
+        
+    df_ep = filter_us_ep_candidates(tickers)
+    if df_ep is None:
+        # 抓取失敗不可誤報成「無符合標的」
+        send_to_discord(f"⚠️ **美股 NTRT 盤前雷達 ({today_str})**\n報價資料抓取失敗 (Yahoo 與 yfinance 皆無回應)，本次掃描結果無效，請手動重跑。")
+        return
+    if df_ep.empty:
+        send_to_discord(f"📊 **美股 NTRT 盤前雷達 ({today_str})**\n昨晚至今日盤前發布財報的公司中，無符合「YoY>39% + 市值<10B + 均量<1.5M」的量化標的。")
+        return
+        
+    # 依 YoY 取 Top 10 (nlargest 以 heap 選取，不必整表排序)，確保提示詞精練
+    df_ep = df_ep.nlargest(10, 'YoY(%)')
+    
+    rows = df_ep[['Ticker', 'Name', 'YoY(%)', 'MarketCap(B)', 'AvgVol(K)']].itertuples(index=False, name=None)
+    lines = [
+        # 欄位已降為 float32，固定小數位數避免印出 45.29999923706055 之類的尾數
+        f"- ${ticker} {name} | YoY: {yoy:.1f}% | 市值: ${cap:.2f}B | 均量: {vol:.1f}K"
+        for ticker, name, yoy, cap, vol in rows
+    ]
+    stock_list_str = "\n".join(lines) + "\n"
+    
+    discord_msg = PROMPT_TEMPLATE.format(today_str=today_str, stock_list_str=stock_list_str)
+    
+    send_to_discord(discord_msg)
+
+if __name__ == "__main__":
+    main()